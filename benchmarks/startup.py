@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Measure the startup latency of compress-pptx.
+
+Reports the time to import the CLI module in a fresh interpreter and the time to
+construct a CompressPptx instance (including tool discovery).
+
+Usage:
+    python benchmarks/startup.py [-n RUNS]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TEST_FILE = os.path.join(HERE, "..", "tests", "test.pptx")
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import compress_pptx.__main__
+print(time.perf_counter() - start)
+"""
+
+CONSTRUCT_SNIPPET = """
+import sys, time
+from compress_pptx.compress_pptx import CompressPptx
+start = time.perf_counter()
+CompressPptx(sys.argv[1], sys.argv[2], force=True)
+print(time.perf_counter() - start)
+"""
+
+
+def run_snippet(snippet, *args):
+    stdout = subprocess.run(
+        [sys.executable, "-c", snippet, *args],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return float(stdout.strip().splitlines()[-1])
+
+
+def time_process(*args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def report(name, timings):
+    print(
+        f"{name:<12} median {statistics.median(timings) * 1000:7.1f} ms, "
+        f"min {min(timings) * 1000:7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--runs", type=int, default=20, help="Number of runs")
+    cli_args = parser.parse_args()
+
+    report(
+        "interpreter",
+        [time_process("-c", "pass") for _ in range(cli_args.runs)],
+    )
+    report(
+        "--help",
+        [time_process("-m", "compress_pptx", "-h") for _ in range(cli_args.runs)],
+    )
+    report(
+        "import",
+        [run_snippet(IMPORT_SNIPPET) for _ in range(cli_args.runs)],
+    )
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_file = os.path.join(temp_dir, "out.pptx")
+        try:
+            timings = [
+                run_snippet(CONSTRUCT_SNIPPET, TEST_FILE, output_file)
+                for _ in range(cli_args.runs)
+            ]
+        except subprocess.CalledProcessError as e:
+            print(f"construct    skipped: {e.stderr.strip().splitlines()[-1]}")
+        else:
+            report("construct", timings)
+
+
+if __name__ == "__main__":
+    main()
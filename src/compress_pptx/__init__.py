@@ -1,3 +1,7 @@
-import importlib.metadata
+def __getattr__(name):
+    # resolved lazily, since importlib.metadata is slow to import
+    if name == "__version__":
+        import importlib.metadata
 
-__version__ = importlib.metadata.version("compress_pptx")
+        return importlib.metadata.version("compress_pptx")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,8 +3,16 @@ import os
 import sys
 
 from .compress_pptx import CompressPptx, CompressPptxError
+from .events import ConsoleSink, JsonLinesSink, QuietSink
 from .util import convert_size_to_bytes
 
+# event sinks selectable with --progress
+PROGRESS_SINKS = {
+    "console": ConsoleSink,
+    "json": JsonLinesSink,
+    "quiet": QuietSink,
+}
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -103,8 +111,72 @@ def main():
         help="Path to ffmpeg executable",
         default="ffmpeg",
     )
+    parser.add_argument(
+        "--target-ssim",
+        type=float,
+        help="Encode each image at the lowest JPEG quality reaching this SSIM (0-1, e.g. 0.98) instead of a fixed quality (requires numpy)",
+        default=None,
+    )
+    parser.add_argument(
+        "--min-quality",
+        type=int,
+        help="Lowest JPEG quality to consider when using --target-ssim",
+        default=CompressPptx.DEFAULT_MIN_QUALITY,
+    )
+    parser.add_argument(
+        "--target-size",
+        type=str,
+        help="Maximum output file size. Image qualities are chosen to fit, downscaling images if needed. Also accepts the suffixes k/M/G or KiB/MiB/GiB",
+        default=None,
+    )
+    parser.add_argument(
+        "--smallest-format",
+        action="store_true",
+        help="Encode images as JPEG, optimized PNG and palette PNG in parallel and keep the smallest result, or the original if it is smaller",
+    )
+    parser.add_argument(
+        "--speech-sample-rate",
+        type=int,
+        help="Sample rate for audio detected as speech (used with -m)",
+        default=CompressPptx.DEFAULT_SPEECH_SAMPLE_RATE,
+    )
+    parser.add_argument(
+        "--speech-bitrate",
+        type=str,
+        help="Bitrate for audio detected as speech (used with -m)",
+        default=CompressPptx.DEFAULT_SPEECH_BITRATE,
+    )
+    parser.add_argument(
+        "--video-dpi",
+        type=float,
+        help="Downscale videos to their largest size on the slides at this DPI (used with -m, e.g. 144)",
+        default=None,
+    )
+    parser.add_argument(
+        "--video-max-fps",
+        type=float,
+        help="Maximum frame rate of videos (used with -m)",
+        default=None,
+    )
+    parser.add_argument(
+        "--progress",
+        choices=list(PROGRESS_SINKS),
+        help="How to report progress: human-readable output, one JSON event per line on stdout, or nothing but errors",
+        default="console",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        help="Minimum time in seconds between progress updates of a file",
+        default=CompressPptx.DEFAULT_PROGRESS_INTERVAL,
+    )
     cli_args = parser.parse_args()
 
+    if cli_args.progress == "console":
+        event_sink = ConsoleSink(verbose=cli_args.verbose)
+    else:
+        event_sink = PROGRESS_SINKS[cli_args.progress]()
+
     basename, _ = os.path.splitext(cli_args.input)
     output = (
         cli_args.output
@@ -113,6 +185,11 @@ def main():
     )
 
     size_bytes = convert_size_to_bytes(cli_args.size)
+    target_size_bytes = (
+        convert_size_to_bytes(cli_args.target_size)
+        if cli_args.target_size is not None
+        else None
+    )
 
     try:
         CompressPptx(
@@ -134,9 +211,22 @@ def main():
             ffmpeg_audio_codec=cli_args.ffmpeg_audio_codec,
             ffmpeg_extra_options=cli_args.ffmpeg_extra_options,
             ffmpeg_path=cli_args.ffmpeg_path,
+            target_ssim=cli_args.target_ssim,
+            min_quality=cli_args.min_quality,
+            target_size=target_size_bytes,
+            smallest_format=cli_args.smallest_format,
+            speech_sample_rate=cli_args.speech_sample_rate,
+            speech_bitrate=cli_args.speech_bitrate,
+            video_dpi=cli_args.video_dpi,
+            video_max_fps=cli_args.video_max_fps,
+            event_sink=event_sink,
+            progress_interval=cli_args.progress_interval,
         ).run()
     except CompressPptxError as e:
-        print(f"Error: {e}")
+        if cli_args.progress == "json":
+            event_sink({"event": "error", "text": str(e)})
+        else:
+            print(f"Error: {e}")
         sys.exit(1)
     except Exception as e:
         raise e
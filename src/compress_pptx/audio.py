@@ -0,0 +1,182 @@
+import json
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple, TypedDict
+
+from .util import run_command
+
+# maximum duration in seconds analyzed per file
+ANALYSIS_DURATION = 300
+# difference between channels below which stereo is considered dual mono (dBFS)
+DUAL_MONO_MAX_VOLUME = -60.0
+# frequency above which speech has little energy, and the energy ratio (dB) below
+# which content is considered speech-like
+SPEECH_CUTOFF_FREQUENCY = 8000
+SPEECH_HIGH_BAND_RATIO = -30.0
+# ratio (dB) of the difference of the channels to the full signal below which stereo
+# speech may be downmixed, so that band-limited stereo music is left alone
+SPEECH_SIDE_RATIO = -20.0
+
+
+class AudioInfo(TypedDict):
+    channels: int
+    sample_rate: int
+    dual_mono: bool
+    speech: bool
+
+
+def ffprobe_path(ffmpeg_path: str) -> str:
+    """Return the path to the ffprobe executable next to the given ffmpeg."""
+    path = Path(ffmpeg_path)
+    return str(path.with_name(path.name.replace("ffmpeg", "ffprobe")))
+
+
+def probe_audio(
+    ffprobe_path: str, input_file: str, verbose: bool = False
+) -> Tuple[int, int]:
+    """Return the number of channels and the sample rate of the first audio stream."""
+    cmd = [
+        ffprobe_path,
+        "-v",
+        "error",
+        "-select_streams",
+        "a:0",
+        "-show_entries",
+        "stream=channels,sample_rate",
+        "-of",
+        "json",
+        input_file,
+    ]
+    stdout, _ = run_command(cmd, verbose=verbose)
+    streams = json.loads(stdout).get("streams", [])
+    if len(streams) == 0:
+        raise RuntimeError(f"No audio stream found in {input_file}")
+    return int(streams[0]["channels"]), int(streams[0]["sample_rate"])
+
+
+def parse_volume(stderr: str) -> Tuple[float, float]:
+    """Parse the mean and max volume in dBFS from ffmpeg volumedetect output."""
+    mean = re.search(r"mean_volume: (\S+) dB", stderr)
+    peak = re.search(r"max_volume: (\S+) dB", stderr)
+    if mean is None or peak is None:
+        # volumedetect prints nothing if there were no samples
+        return float("-inf"), float("-inf")
+    return float(mean.group(1)), float(peak.group(1))
+
+
+def _detect_volume(
+    ffmpeg_path: str, input_file: str, audio_filter: str, verbose: bool = False
+) -> Tuple[float, float]:
+    cmd = [
+        ffmpeg_path,
+        "-hide_banner",
+        "-nostats",
+        "-t",
+        str(ANALYSIS_DURATION),
+        "-i",
+        input_file,
+        "-vn",
+        "-af",
+        f"{audio_filter}volumedetect",
+        "-f",
+        "null",
+        "-",
+    ]
+    _, stderr = run_command(cmd, verbose=verbose)
+    return parse_volume(stderr)
+
+
+def classify_audio(
+    channels: int,
+    sample_rate: int,
+    full_mean: float,
+    high_mean: float,
+    side: Optional[Tuple[float, float]] = None,
+) -> Tuple[bool, bool]:
+    """
+    Decide whether audio is dual mono and whether it is speech-like.
+
+    Args:
+        channels (int): Number of channels
+        sample_rate (int): Sample rate in Hz
+        full_mean (float): Mean volume of the full signal in dBFS
+        high_mean (float): Mean volume above the speech cutoff frequency in dBFS
+        side (Tuple[float, float], optional): Mean and max volume of the difference of
+            the channels in dBFS, for stereo. Defaults to None.
+
+    Returns:
+        Tuple[bool, bool]: Whether the audio is dual mono and whether it is speech-like
+    """
+    dual_mono = False
+    narrow_stereo = channels == 1
+    if channels == 2 and side is not None:
+        side_mean, side_peak = side
+        dual_mono = side_peak < DUAL_MONO_MAX_VOLUME
+        narrow_stereo = side_mean - full_mean < SPEECH_SIDE_RATIO
+
+    band_limited = (
+        sample_rate > 2 * SPEECH_CUTOFF_FREQUENCY
+        and high_mean - full_mean < SPEECH_HIGH_BAND_RATIO
+    )
+    return dual_mono, band_limited and (dual_mono or narrow_stereo)
+
+
+def analyze_audio(
+    ffmpeg_path: str, input_file: str, verbose: bool = False
+) -> AudioInfo:
+    """
+    Probe an audio file and detect dual mono and speech-like content.
+
+    Content is considered speech-like if it has little energy above 8 kHz, so that
+    resampling to a lower rate loses little, and, for stereo, if its channels barely
+    differ, so that downmixing loses little.
+
+    Args:
+        ffmpeg_path (str): Path to ffmpeg executable, ffprobe is expected next to it
+        input_file (str): Path to audio file
+        verbose (bool, optional): Show commands. Defaults to False.
+
+    Returns:
+        AudioInfo: The channels, sample rate and detected content
+    """
+    channels, sample_rate = probe_audio(ffprobe_path(ffmpeg_path), input_file, verbose)
+
+    side = None
+    if channels == 2:
+        # the difference of identical channels is silent
+        side = _detect_volume(ffmpeg_path, input_file, "pan=mono|c0=c0-c1,", verbose)
+
+    full_mean, _ = _detect_volume(ffmpeg_path, input_file, "", verbose)
+    high_mean, _ = _detect_volume(
+        ffmpeg_path, input_file, f"highpass=f={SPEECH_CUTOFF_FREQUENCY},", verbose
+    )
+    dual_mono, speech = classify_audio(
+        channels, sample_rate, full_mean, high_mean, side
+    )
+
+    return {
+        "channels": channels,
+        "sample_rate": sample_rate,
+        "dual_mono": dual_mono,
+        "speech": speech,
+    }
+
+
+def audio_args(
+    info: AudioInfo, speech_sample_rate: int, speech_bitrate: Optional[str]
+) -> List[str]:
+    """
+    Return the ffmpeg output options for an analyzed audio file.
+
+    Dual mono is downmixed to mono. Speech-like content is downmixed, resampled and
+    encoded with the speech profile.
+    """
+    args: List[str] = []
+    if info["channels"] > 1 and (info["dual_mono"] or info["speech"]):
+        args.extend(["-ac", "1"])
+    if info["speech"]:
+        if info["sample_rate"] > speech_sample_rate:
+            args.extend(["-ar", str(speech_sample_rate)])
+        if speech_bitrate is not None:
+            args.extend(["-b:a", speech_bitrate])
+    return args
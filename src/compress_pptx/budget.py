@@ -0,0 +1,107 @@
+import math
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# JPEG qualities tried per image to estimate its rate-size curve
+QUALITY_SWEEP = [30, 45, 60, 75, 85, 95]
+# smallest downscaling factor (in percent) used when quality alone can't fit
+MIN_RESIZE_PERCENT = 10
+# approximate size of the local and central directory headers of a zip entry
+ZIP_ENTRY_OVERHEAD = 76
+# extensions of formats that are already compressed and barely shrink when deflated
+COMPRESSED_EXTENSIONS = {
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".mp4",
+    ".m4v",
+    ".mov",
+    ".avi",
+    ".mp3",
+    ".m4a",
+    ".wma",
+    ".wmv",
+}
+# size of the chunks deflated at a time
+DEFLATE_CHUNK_SIZE = 1024 * 1024
+
+
+def sweep_qualities(max_quality: int) -> List[int]:
+    """Return the qualities to try for a given maximum quality, in ascending order."""
+    return [q for q in QUALITY_SWEEP if q < max_quality] + [max_quality]
+
+
+def estimate_zipped_size(file: Path, arcname: str) -> int:
+    """
+    Estimate the size a file takes up in a deflated zip archive.
+
+    Already compressed formats are counted at their stored size, other files are
+    deflated in chunks.
+    """
+    size = file.stat().st_size
+    if file.suffix.lower() not in COMPRESSED_EXTENSIONS:
+        compressor = zlib.compressobj()
+        compressed = 0
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(DEFLATE_CHUNK_SIZE), b""):
+                compressed += len(compressor.compress(chunk))
+        compressed += len(compressor.flush())
+        size = min(size, compressed)
+    return size + ZIP_ENTRY_OVERHEAD + 2 * len(arcname)
+
+
+def allocate(curves: List[Dict[int, int]], budget: int) -> Optional[List[int]]:
+    """
+    Choose one quality per item so that the total size fits into a byte budget.
+
+    Starting from the highest quality of every item, the step down with the most
+    bytes saved per quality point lost is taken until the budget is met.
+
+    Args:
+        curves (List[Dict[int, int]]): Output size in bytes per quality, for each item
+        budget (int): Maximum total size in bytes
+
+    Returns:
+        Optional[List[int]]: The chosen quality per item, or None if even the lowest
+            qualities exceed the budget
+    """
+    levels = [sorted(curve) for curve in curves]
+    if sum(curve[level[0]] for curve, level in zip(curves, levels)) > budget:
+        return None
+
+    indices = [len(level) - 1 for level in levels]
+    total = sum(curve[level[-1]] for curve, level in zip(curves, levels))
+    while total > budget:
+        best = None
+        best_ratio = -math.inf
+        for n, (curve, level) in enumerate(zip(curves, levels)):
+            i = indices[n]
+            if i == 0:
+                continue
+            saved = curve[level[i]] - curve[level[i - 1]]
+            ratio = saved / (level[i] - level[i - 1])
+            if ratio > best_ratio:
+                best, best_ratio = n, ratio
+        if best is None:
+            break
+        level = levels[best]
+        total -= curves[best][level[indices[best]]]
+        indices[best] -= 1
+        total += curves[best][level[indices[best]]]
+
+    return [level[i] for level, i in zip(levels, indices)]
+
+
+def resize_percent(min_total: int, budget: int) -> int:
+    """
+    Estimate the downscaling factor needed to fit images into a byte budget.
+
+    Assumes the output size scales with the pixel count, i.e. the square of the factor.
+    """
+    if budget <= 0:
+        return MIN_RESIZE_PERCENT
+    # leave some headroom since small images compress less efficiently
+    linear = math.sqrt(0.9 * budget / min_total)
+    return max(MIN_RESIZE_PERCENT, min(100, int(linear * 100)))
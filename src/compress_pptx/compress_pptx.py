@@ -1,15 +1,37 @@
 import glob
 import os
+import re
 import shutil
+import sys
 import tempfile
+import time
 import zipfile
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
-from typing import List, Optional, TypedDict
-
-from ffmpeg_progress_yield import FfmpegProgress
-from tqdm import tqdm
-from tqdm.contrib.concurrent import process_map
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Tuple,
+    TypedDict,
+    TypeVar,
+)
 
+from .audio import AudioInfo, analyze_audio, audio_args, ffprobe_path
+from .budget import allocate, estimate_zipped_size, resize_percent, sweep_qualities
+from .events import ConsoleSink, EventSink, ProgressThrottle
+from .perceptual import has_numpy, read_luma, search_quality, ssim
+from .video import (
+    add_video_filters,
+    extent_to_pixels,
+    media_extents,
+    probe_frame_rate,
+    scale_filter,
+)
 from .util import (
     convert_size_to_bytes,
     file_size,
@@ -18,14 +40,31 @@ from .util import (
     which,
 )
 
+T = TypeVar("T")
+
+# content types of the extensions compressed files can end up with
+CONTENT_TYPES = {
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "mp4": "video/mp4",
+    "mp3": "audio/mpeg",
+}
+
 
 class FileObj(TypedDict):
     is_image: bool
+    is_audio: bool
     input: str
     output: str
     input_size: int
     output_size: Optional[int]
     quality: int
+    min_quality: int
+    max_quality: int
+    target_ssim: Optional[float]
+    ssim: Optional[float]
+    resize: Optional[int]
     transparency: str
     verbose: bool
     convert_cmd: List[str]
@@ -34,26 +73,191 @@ class FileObj(TypedDict):
     ffmpeg_audio_codec: Optional[str]
     ffmpeg_extra_options: Optional[str]
     ffmpeg_path: str
+    speech_sample_rate: int
+    speech_bitrate: Optional[str]
+    video_size: Optional[Tuple[int, int]]
+    video_max_fps: Optional[float]
+    duration: float
+
 
+def _timed(fn: Callable[[FileObj], T], file: FileObj) -> Tuple[T, float]:
+    """Apply a function to a file, also returning the time it took in seconds."""
+    start = time.monotonic()
+    result = fn(file)
+    return result, time.monotonic() - start
 
-def _compress_image(file: FileObj):
-    """Compress an image file using ImageMagick."""
+
+def _convert_input_cmd(file: FileObj) -> List[str]:
+    """Return the ImageMagick command reading and flattening an image file."""
     cmd = file["convert_cmd"] + [
         file["input"] + "[0]",  # add [0] to use only the first page of TIFFs
         "-background",
         file["transparency"],
         "-flatten",
+    ]
+    if file["resize"] is not None:
+        cmd.extend(["-resize", f"{file['resize']}%"])
+    return cmd
+
+
+def _encode_image(file: FileObj, quality: int, output: Optional[str] = None) -> None:
+    """Encode an image file at the given quality using ImageMagick."""
+    cmd = _convert_input_cmd(file) + [
         "-quality",
-        str(file["quality"]),
-        file["output"],
+        str(quality),
+        output or file["output"],
+    ]
+    run_command(cmd, verbose=file["verbose"])
+
+
+def _encode_png(file: FileObj, output: str, palette: bool = False) -> None:
+    """Encode an image file as an optimized, optionally palettized PNG."""
+    cmd = _convert_input_cmd(file) + [
+        "-strip",
+        "-define",
+        "png:compression-level=9",
+        "-define",
+        "png:compression-filter=5",
+        ("PNG8:" if palette else "") + output,
     ]
     run_command(cmd, verbose=file["verbose"])
 
 
-def _compress_video_with_progress(file: FileObj, pbar_position: int = 1) -> None:
-    """Compress a video file using ffmpeg with progress reporting."""
+def _count_colors(file: FileObj) -> int:
+    cmd = _convert_input_cmd(file) + ["-format", "%k", "info:"]
+    stdout, _ = run_command(cmd, verbose=file["verbose"])
+    return int(stdout.strip())
+
+
+def _trial_output(file: FileObj, trial_dir: str, quality: int) -> str:
+    output = Path(file["output"])
+    return (Path(trial_dir) / f"{output.stem}-q{quality}{output.suffix}").as_posix()
+
+
+def _sweep_image(file: FileObj, trial_dir: str) -> Dict[int, int]:
+    """
+    Encode an image file at several qualities into a trial directory.
+
+    Returns:
+        Dict[int, int]: The output size in bytes per quality
+    """
+    sizes = {}
+    for quality in sweep_qualities(file["quality"]):
+        output = _trial_output(file, trial_dir, quality)
+        _encode_image(file, quality, output)
+        sizes[quality] = file_size(output)
+    return sizes
+
+
+def _compress_image(file: FileObj) -> Tuple[str, int, Optional[float]]:
+    """
+    Compress an image file using ImageMagick.
+
+    If a target SSIM is set, the lowest quality reaching it is searched for.
+
+    Returns:
+        Tuple[str, int, Optional[float]]: The output file, the quality used and the SSIM
+            reached, if measured
+    """
+    target_ssim = file["target_ssim"]
+    if target_ssim is None:
+        _encode_image(file, file["quality"])
+        return file["output"], file["quality"], None
+
+    reference = read_luma(
+        file["convert_cmd"], file["input"], file["transparency"], file["verbose"]
+    )
+
+    def measure() -> float:
+        distorted = read_luma(
+            file["convert_cmd"], file["output"], file["transparency"], file["verbose"]
+        )
+        return ssim(reference, distorted)
+
+    quality, score = search_quality(
+        lambda quality: _encode_image(file, quality),
+        measure,
+        target_ssim,
+        file["min_quality"],
+        file["max_quality"],
+    )
+    return file["output"], quality, score
+
+
+def _compress_image_smallest(
+    file: FileObj,
+) -> Tuple[str, Optional[int], Optional[float]]:
+    """
+    Compress an image file into several formats in parallel and keep the smallest.
+
+    The candidates are the JPEG from `_compress_image`, an optimized PNG, a palette PNG
+    (only if lossless or reaching the target SSIM) and the untouched original.
+
+    Returns:
+        Tuple[str, Optional[int], Optional[float]]: The output file (the input file if
+            the original is kept), and the JPEG quality and SSIM, if the JPEG was kept
+    """
+    output = Path(file["output"])
+    png_output = (output.parent / (output.stem + ".png")).as_posix()
+    palette_output = (output.parent / (output.stem + "-palette.png")).as_posix()
+
+    def palette_candidate() -> bool:
+        target_ssim = file["target_ssim"]
+        lossless = _count_colors(file) <= 256
+        if not lossless and target_ssim is None:
+            return False
+        _encode_png(file, palette_output, palette=True)
+        if lossless or target_ssim is None:
+            return lossless
+        reference = read_luma(
+            file["convert_cmd"], file["input"], file["transparency"], file["verbose"]
+        )
+        distorted = read_luma(
+            file["convert_cmd"], palette_output, file["transparency"], file["verbose"]
+        )
+        return ssim(reference, distorted) >= target_ssim
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    # the encoders run as subprocesses, so threads are enough to run them in parallel
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        jpeg_future = pool.submit(_compress_image, file)
+        png_future = pool.submit(_encode_png, file, png_output)
+        palette_future = pool.submit(palette_candidate)
+        _, quality, score = jpeg_future.result()
+        png_future.result()
+        candidates = [file["input"], file["output"], png_output]
+        if palette_future.result():
+            candidates.append(palette_output)
+
+    # on ties, prefer the original and then the simpler formats
+    best = min(candidates, key=file_size)
+    for candidate in (file["output"], png_output, palette_output):
+        if candidate != best and os.path.exists(candidate):
+            os.remove(candidate)
+    if best == palette_output:
+        os.rename(palette_output, png_output)
+        best = png_output
+
+    if best != file["output"]:
+        return best, None, None
+    return best, quality, score
+
+
+def _compress_video_with_progress(
+    file: FileObj, on_progress: Callable[[float], None]
+) -> Optional[str]:
+    """
+    Compress a video file using ffmpeg, reporting the progress in percent.
+
+    Returns:
+        Optional[str]: The error probing the frame rate, if any, in which case the
+            frame rate is not capped
+    """
     import shlex
 
+    from ffmpeg_progress_yield import FfmpegProgress
+
     cmd = [file["ffmpeg_path"], "-i", file["input"]]
 
     # Add video codec if specified
@@ -64,33 +268,83 @@ def _compress_video_with_progress(file: FileObj, pbar_position: int = 1) -> None
     if file["ffmpeg_crf"] is not None:
         cmd.extend(["-crf", str(file["ffmpeg_crf"])])
 
+    # Fit into the on-slide frame size and cap the frame rate if specified
+    filters = []
+    error = None
+    if file["video_size"] is not None:
+        filters.append(scale_filter(*file["video_size"]))
+    if file["video_max_fps"] is not None:
+        try:
+            fps = probe_frame_rate(
+                ffprobe_path(file["ffmpeg_path"]), file["input"], file["verbose"]
+            )
+        except RuntimeError as e:
+            fps, error = None, str(e)
+        if fps is not None and fps > file["video_max_fps"]:
+            filters.append(f"fps={file['video_max_fps']:g}")
+
     # Add audio codec if specified
     if file["ffmpeg_audio_codec"]:
         cmd.extend(["-codec:a", file["ffmpeg_audio_codec"]])
 
-    # Add extra options if specified (parse the string into arguments)
+    # Add extra options if specified (parse the string into arguments), merging
+    # the filters into a video filter chain given there
+    extra_args = []
     if file["ffmpeg_extra_options"]:
         extra_args = shlex.split(file["ffmpeg_extra_options"])
-        cmd.extend(extra_args)
+    cmd.extend(add_video_filters(extra_args, filters))
 
     cmd.extend(["-y", file["output"]])
 
     if file["verbose"]:
-        print(" ".join([shlex.quote(str(c)) for c in cmd]))
+        # on stderr, to keep stdout free for JSON events
+        print(" ".join([shlex.quote(str(c)) for c in cmd]), file=sys.stderr)
 
     ff = FfmpegProgress(cmd)
-    filename = Path(file["input"]).name
-    with tqdm(
-        total=100,
-        desc=f"  {filename}",
-        unit="%",
-        position=pbar_position,
-        leave=False,
-        bar_format="{desc}: {percentage:3.0f}%|{bar}| [{elapsed}<{remaining}]",
-    ) as pbar:
-        for progress in ff.run_command_with_progress():
-            pbar.n = progress
-            pbar.refresh()
+    for progress in ff.run_command_with_progress():
+        on_progress(progress)
+    return error
+
+
+def _compress_audio(file: FileObj) -> Tuple[str, Optional[AudioInfo], Optional[str]]:
+    """
+    Compress an audio file using ffmpeg, using the speech profile for speech-like content.
+
+    Returns:
+        Tuple[str, Optional[AudioInfo], Optional[str]]: The output file (the input file
+            if the output was not smaller), the analysis result and the analysis error,
+            if any
+    """
+    import shlex
+
+    try:
+        info: Optional[AudioInfo] = analyze_audio(
+            file["ffmpeg_path"], file["input"], file["verbose"]
+        )
+        error = None
+    except RuntimeError as e:
+        info, error = None, str(e)
+
+    cmd = [file["ffmpeg_path"], "-i", file["input"], "-vn"]
+
+    # Add audio codec if specified
+    if file["ffmpeg_audio_codec"]:
+        cmd.extend(["-codec:a", file["ffmpeg_audio_codec"]])
+
+    if info is not None:
+        cmd.extend(audio_args(info, file["speech_sample_rate"], file["speech_bitrate"]))
+
+    # Add extra options if specified (parse the string into arguments)
+    if file["ffmpeg_extra_options"]:
+        cmd.extend(shlex.split(file["ffmpeg_extra_options"]))
+
+    cmd.extend(["-y", file["output"]])
+    run_command(cmd, verbose=file["verbose"])
+
+    if file_size(file["output"]) >= file["input_size"]:
+        os.remove(file["output"])
+        return file["input"], info, error
+    return file["output"], info, error
 
 
 def _has_transparency(input_file: str, identify_cmd: List[str], verbose=False) -> bool:
@@ -109,6 +363,14 @@ class CompressPptx:
     DEFAULT_QUALITY = 85
     DEFAULT_SIZE = "1MiB"
     DEFAULT_TRANSPARENCY = "white"
+    DEFAULT_MIN_QUALITY = 40
+    PERCEPTUAL_MAX_QUALITY = 95
+    DEFAULT_SPEECH_SAMPLE_RATE = 24000
+    DEFAULT_SPEECH_BITRATE = "48k"
+    # fraction of the target size kept free to account for estimation errors
+    TARGET_SIZE_MARGIN = 0.02
+    # minimum time in seconds between progress events of a file
+    DEFAULT_PROGRESS_INTERVAL = 0.5
 
     temp_dir: Optional[str]
 
@@ -132,6 +394,16 @@ class CompressPptx:
         ffmpeg_audio_codec: Optional[str] = None,
         ffmpeg_extra_options: Optional[str] = None,
         ffmpeg_path: str = "ffmpeg",
+        target_ssim: Optional[float] = None,
+        min_quality: int = DEFAULT_MIN_QUALITY,
+        target_size: Optional[int] = None,
+        smallest_format: bool = False,
+        speech_sample_rate: int = DEFAULT_SPEECH_SAMPLE_RATE,
+        speech_bitrate: Optional[str] = DEFAULT_SPEECH_BITRATE,
+        video_dpi: Optional[float] = None,
+        video_max_fps: Optional[float] = None,
+        event_sink: Optional[EventSink] = None,
+        progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
     ) -> None:
         """
         Compress images in a PowerPoint file or extract media.
@@ -155,6 +427,16 @@ class CompressPptx:
             ffmpeg_audio_codec (str, optional): FFmpeg audio codec. Defaults to None.
             ffmpeg_extra_options (str, optional): Extra FFmpeg options as a string. Defaults to None.
             ffmpeg_path (str, optional): Path to ffmpeg executable. Defaults to "ffmpeg".
+            target_ssim (float, optional): Encode each image at the lowest JPEG quality reaching this SSIM (0-1) instead of a fixed quality (requires numpy). Defaults to None.
+            min_quality (int, optional): Lowest JPEG quality to consider when targeting an SSIM. Defaults to 40.
+            target_size (int, optional): Maximum size of the output file in bytes. Image qualities are chosen to fit, downscaling images if needed. Defaults to None.
+            smallest_format (bool, optional): Encode images as JPEG and PNG and keep the smallest result, or the original if it is smaller. Defaults to False.
+            speech_sample_rate (int, optional): Sample rate for audio detected as speech. Defaults to 24000.
+            speech_bitrate (str, optional): Bitrate for audio detected as speech, or None for the encoder default. Defaults to "48k".
+            video_dpi (float, optional): Downscale videos to their largest on-slide size at this DPI. Defaults to None.
+            video_max_fps (float, optional): Maximum frame rate of videos. Defaults to None.
+            event_sink (EventSink, optional): Callable receiving progress events. Defaults to a ConsoleSink printing to the console.
+            progress_interval (float, optional): Minimum time in seconds between progress events of a file. Defaults to 0.5.
         """
         self.input_file = input_file
         self.output_file = output_file
@@ -173,6 +455,16 @@ class CompressPptx:
         self.ffmpeg_audio_codec = ffmpeg_audio_codec
         self.ffmpeg_extra_options = ffmpeg_extra_options
         self.ffmpeg_path = ffmpeg_path
+        self.target_ssim = None if target_ssim is None else float(target_ssim)
+        self.min_quality = int(min_quality)
+        self.target_size = None if target_size is None else int(target_size)
+        self.smallest_format = bool(smallest_format)
+        self.speech_sample_rate = int(speech_sample_rate)
+        self.speech_bitrate = speech_bitrate
+        self.video_dpi = None if video_dpi is None else float(video_dpi)
+        self.video_max_fps = None if video_max_fps is None else float(video_max_fps)
+        self.event_sink = event_sink or ConsoleSink(verbose=self.verbose)
+        self.progress_interval = float(progress_interval)
 
         # file extensions and conversions
         self.image_extensions = [".png", ".emf", ".tiff"]
@@ -205,6 +497,7 @@ class CompressPptx:
         # add ffmpeg to required executables if user wants media files to be compressed
         if self.compress_media:
             required_executables.append(self.ffmpeg_path)
+            required_executables.append(ffprobe_path(self.ffmpeg_path))
         # add "unoconv" (libreoffice package) to required executables of user wants emf files compressed
         if self.use_libreoffice:
             required_executables.append("unoconv")
@@ -218,6 +511,39 @@ class CompressPptx:
         if self.quality < 0 or self.quality > 100:
             raise CompressPptxError("Quality must be between 0-100!")
 
+        if self.target_ssim is not None:
+            if self.target_ssim <= 0 or self.target_ssim > 1:
+                raise CompressPptxError("Target SSIM must be between 0-1!")
+            if self.min_quality < 0 or self.min_quality > self.PERCEPTUAL_MAX_QUALITY:
+                raise CompressPptxError(
+                    f"Minimum quality must be between 0-{self.PERCEPTUAL_MAX_QUALITY}!"
+                )
+            if self.target_size is not None:
+                raise CompressPptxError(
+                    "Target SSIM and target size cannot be used together!"
+                )
+            if not has_numpy():
+                raise CompressPptxError(
+                    "numpy is required for SSIM targeting. Install it with 'pip install compress_pptx[perceptual]'."
+                )
+
+        if self.target_size is not None:
+            if self.target_size <= 0:
+                raise CompressPptxError("Target size must be positive!")
+            if self.smallest_format:
+                raise CompressPptxError(
+                    "Target size and smallest format cannot be used together!"
+                )
+
+        if self.video_dpi is not None and self.video_dpi <= 0:
+            raise CompressPptxError("Video DPI must be positive!")
+
+        if self.video_max_fps is not None and self.video_max_fps <= 0:
+            raise CompressPptxError("Maximum video frame rate must be positive!")
+
+        if self.progress_interval < 0:
+            raise CompressPptxError("Progress interval must not be negative!")
+
         if not Path(self.input_file).exists():
             raise CompressPptxError(f"No such file: {self.input_file}")
 
@@ -242,8 +568,9 @@ class CompressPptx:
             self._extract_media()
         else:
             # Compression mode
-            if self.verbose:
-                print(f"Converting {self.input_file} to {self.output_file}")
+            self._message(
+                f"Converting {self.input_file} to {self.output_file}", level="debug"
+            )
 
             with tempfile.TemporaryDirectory() as temp_dir:
                 self.temp_dir = temp_dir
@@ -258,13 +585,49 @@ class CompressPptx:
                 self._compress_files()
 
                 # Replace rels
-                self._replace_rels()
+                with self._stage("replace_rels"):
+                    self._replace_rels()
+
+                # Register new file extensions
+                self._update_content_types()
 
                 # Zip back
                 self._zip()
 
-            # Always print stats to show compression results
-            self._print_stats()
+            # Always report stats to show compression results
+            self._report_stats()
+
+    def _emit(self, event: str, **fields: Any) -> None:
+        """Send an event to the event sink."""
+        self.event_sink(
+            {"event": event, "time": time.time(), "input_file": self.input_file}
+            | fields
+        )
+
+    def _message(self, text: str, level: str = "info") -> None:
+        self._emit("message", level=level, text=text)
+
+    def _file_fields(self, file: FileObj) -> Dict[str, Any]:
+        return {"file": Path(file["input"]).name, "path": file["input"]}
+
+    @contextmanager
+    def _stage(self, stage: str, **fields: Any) -> Generator[None, None, None]:
+        """Emit events around a stage of the compression, measuring its duration."""
+        self._emit("stage_started", stage=stage, **fields)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._emit(
+                "stage_finished",
+                stage=stage,
+                duration=time.monotonic() - start,
+                **fields,
+            )
+
+    def _file_finished(self, file: FileObj, duration: float) -> None:
+        file["duration"] += duration
+        self._emit("file_finished", duration=duration, **self._file_fields(file))
 
     def _extract_media(self) -> None:
         """Extract all media files from the presentation to the specified directory."""
@@ -275,8 +638,10 @@ class CompressPptx:
         extract_path = Path(self.extract_dir)
         extract_path.mkdir(parents=True, exist_ok=True)
 
-        if self.verbose:
-            print(f"Extracting media from {self.input_file} to {self.extract_dir}")
+        self._message(
+            f"Extracting media from {self.input_file} to {self.extract_dir}",
+            level="debug",
+        )
 
         extracted_count = 0
         with tempfile.TemporaryDirectory() as temp_dir:
@@ -292,18 +657,17 @@ class CompressPptx:
                     if media_file.is_file():
                         dest_file = extract_path / media_file.name
                         shutil.copy2(media_file, dest_file)
-                        if self.verbose:
-                            print(f"Extracted: {media_file.name}")
+                        self._message(f"Extracted: {media_file.name}", level="debug")
                         extracted_count += 1
 
-        print(f"Extracted {extracted_count} media file(s) to: {self.extract_dir}")
+        self._message(
+            f"Extracted {extracted_count} media file(s) to: {self.extract_dir}"
+        )
 
     def _unzip(self) -> None:
-        print("Extracting file ...")
-        with zipfile.ZipFile(self.input_file, "r") as zip_f:
+        with self._stage("extract"), zipfile.ZipFile(self.input_file, "r") as zip_f:
             zip_f.extractall(self.temp_dir)
-            if self.verbose:
-                print(f"Extracted temp files to {self.temp_dir}")
+        self._message(f"Extracted temp files to {self.temp_dir}", level="debug")
 
     def _check_endswith(self, filename: str, extensions: List[str]) -> bool:
         for ext in extensions:
@@ -315,10 +679,17 @@ class CompressPptx:
         if self.temp_dir is None:
             raise RuntimeError("Temp dir not created!")
 
+        # on-slide sizes of videos, to downscale them to
+        extents = {}
+        if self.compress_media and self.video_dpi is not None:
+            extents = media_extents(self.temp_dir)
+
         for file in glob.iglob(
             os.path.join(self.temp_dir, "ppt", "media", "*"), recursive=True
         ):
             is_image = True
+            is_audio = False
+            video_size = None
             output_extension = self.converted_image_extension
             # skip unaffected extensions
             if not (
@@ -330,7 +701,12 @@ class CompressPptx:
                     is_image = False
                     if self._check_endswith(file, self.video_extensions):
                         output_extension = self.converted_video_extensions
+                        if self.video_dpi is not None and Path(file).name in extents:
+                            video_size = extent_to_pixels(
+                                extents[Path(file).name], self.video_dpi
+                            )
                     elif self._check_endswith(file, self.audio_extensions):
+                        is_audio = True
                         output_extension = self.converted_audio_extensions
                     else:
                         continue  ## file is not a media file
@@ -340,7 +716,9 @@ class CompressPptx:
             # skip files that are too small
             fsize = file_size(file)
             if fsize < self.size:
-                # print(f"Skipping {Path(file).name} because it is too small")
+                self._emit(
+                    "file_skipped", file=Path(file).name, path=file, reason="too_small"
+                )
                 continue
 
             if is_image:  # image file
@@ -348,19 +726,26 @@ class CompressPptx:
                 if self.skip_transparent_images and _has_transparency(
                     file, self.identify_cmd, self.verbose
                 ):
-                    if self.verbose:
-                        print(
-                            f"Skipping {Path(file).name} because it contains transparency"
-                        )
+                    self._emit(
+                        "file_skipped",
+                        file=Path(file).name,
+                        path=file,
+                        reason="transparent",
+                    )
                     continue
 
-            if self.verbose:
-                print(
-                    f"{Path(file).name} added to conversion queue ({human_readable_size(fsize)})"
-                )
+            self._emit(
+                "file_queued",
+                file=Path(file).name,
+                path=file,
+                size=fsize,
+                kind="image" if is_image else "audio" if is_audio else "video",
+                video_size=video_size,
+            )
 
             file_obj: FileObj = {
                 "is_image": is_image,
+                "is_audio": is_audio,
                 "input": file,
                 "output": (
                     Path(file).parent
@@ -369,6 +754,11 @@ class CompressPptx:
                 "input_size": fsize,
                 "output_size": None,
                 "quality": self.quality,
+                "min_quality": self.min_quality,
+                "max_quality": self.PERCEPTUAL_MAX_QUALITY,
+                "target_ssim": self.target_ssim,
+                "ssim": None,
+                "resize": None,
                 "transparency": self.transparency,
                 "verbose": self.verbose,
                 "convert_cmd": self.convert_cmd,
@@ -377,12 +767,18 @@ class CompressPptx:
                 "ffmpeg_audio_codec": self.ffmpeg_audio_codec,
                 "ffmpeg_extra_options": self.ffmpeg_extra_options,
                 "ffmpeg_path": self.ffmpeg_path,
+                "speech_sample_rate": self.speech_sample_rate,
+                "speech_bitrate": self.speech_bitrate,
+                "video_size": video_size,
+                "video_max_fps": self.video_max_fps,
+                "duration": 0.0,
             }
 
             self.file_list.append(file_obj)
 
     def _libreoffice_compress_files(self, files: List[FileObj]):
         for file in files:
+            start = time.monotonic()
             cmd = [
                 "unoconv",
                 "-f",
@@ -392,15 +788,122 @@ class CompressPptx:
                 file["input"],
             ]
             run_command(cmd, verbose=file["verbose"])
+            self._file_finished(file, time.monotonic() - start)
+
+    def _map(self, fn: Callable[[FileObj], T], files: List[FileObj]) -> List[T]:
+        """Apply a function to files, in parallel processes if enabled."""
+        results: Dict[int, T] = {}
+        timed: Callable[[FileObj], Tuple[T, float]] = partial(_timed, fn)
+        if self.num_cpus > 1:
+            from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+
+            with ProcessPoolExecutor(max_workers=self.num_cpus) as executor:
+                futures: Dict[Future[Tuple[T, float]], int] = {
+                    executor.submit(timed, file): i for i, file in enumerate(files)
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    results[i], duration = future.result()
+                    self._file_finished(files[i], duration)
+        else:
+            for i, file in enumerate(files):
+                results[i], duration = timed(file)
+                self._file_finished(file, duration)
+        return [results[i] for i in range(len(files))]
+
+    def _compress_images(self, files: List[FileObj]) -> None:
+        worker = _compress_image_smallest if self.smallest_format else _compress_image
+        results = self._map(worker, files)
+
+        # workers operate on copies, so record the chosen parameters here
+        for file, (output, quality, score) in zip(files, results):
+            file["output"] = output
+            if quality is not None:
+                file["quality"] = quality
+            file["ssim"] = score
+
+    def _estimate_fixed_size(self, files: List[FileObj]) -> int:
+        """Estimate the zipped size of everything except the given files."""
+        if self.temp_dir is None:
+            raise RuntimeError("Temp dir not created!")
+
+        # skip the given files and the originals of already compressed files, but
+        # not the originals that were kept because they were smaller
+        skipped = {Path(f["input"]) for f in files}
+        skipped.update(
+            Path(f["input"])
+            for f in self.file_list
+            if f["output"] != f["input"] and Path(f["output"]).exists()
+        )
+
+        src_path = Path(self.temp_dir)
+        total = 0
+        for file in src_path.rglob("*"):
+            if file.is_file() and file not in skipped:
+                total += estimate_zipped_size(
+                    file, file.relative_to(src_path).as_posix()
+                )
+        return total
+
+    def _compress_images_to_budget(self, files: List[FileObj]) -> None:
+        """Compress images at the qualities that best fit the target size."""
+        if self.target_size is None:
+            raise RuntimeError("Target size not set!")
+
+        budget = int(self.target_size * (1 - self.TARGET_SIZE_MARGIN))
+        budget -= self._estimate_fixed_size(files)
+        self._message(
+            f"Image budget: {human_readable_size(max(budget, 0))}", level="debug"
+        )
+
+        if budget <= 0:
+            # the target can't be met, so get as close as possible without downscaling,
+            # which would only destroy the images
+            quality = sweep_qualities(self.quality)[0]
+            self._message(
+                f"target size of {human_readable_size(self.target_size)} cannot be reached, the rest of the file is too large; compressing images at quality {quality}",
+                level="warning",
+            )
+            for file in files:
+                file["quality"] = quality
+            with self._stage(
+                "compress_images", count=len(files), workers=self.num_cpus
+            ):
+                self._compress_images(files)
+            return
+
+        with tempfile.TemporaryDirectory() as trial_dir:
+            with self._stage("estimate_sizes", count=len(files), workers=self.num_cpus):
+                curves = self._map(partial(_sweep_image, trial_dir=trial_dir), files)
+
+            qualities = allocate(curves, budget)
+            if qualities is not None:
+                # the trial encodes at the chosen qualities are the final outputs
+                for file, quality in zip(files, qualities):
+                    shutil.move(_trial_output(file, trial_dir, quality), file["output"])
+                    file["quality"] = quality
+                return
+
+        # quality alone can't fit, so downscale at the lowest quality
+        min_total = sum(curve[min(curve)] for curve in curves)
+        percent = resize_percent(min_total, budget)
+        for file, curve in zip(files, curves):
+            file["quality"] = min(curve)
+            file["resize"] = percent
+        with self._stage(
+            "downscale_images", count=len(files), workers=self.num_cpus, percent=percent
+        ):
+            self._compress_images(files)
 
     def _compress_files(self) -> None:
         if len(self.file_list) == 0:
-            print("No Files to compress!")
+            self._message("No Files to compress!")
             return
 
         for file in self.file_list:
-            if self.verbose:
-                print(f"Compressing {file['input']} to {file['output']}")
+            self._message(
+                f"Compressing {file['input']} to {file['output']}", level="debug"
+            )
 
         # Separate files by type
         image_files = [
@@ -409,55 +912,96 @@ class CompressPptx:
             if f["is_image"] and not f["input"].endswith(".emf")
         ]
         emf_files = [f for f in self.file_list if f["input"].endswith(".emf")]
-        media_files = [f for f in self.file_list if not f["is_image"]]
+        audio_files = [f for f in self.file_list if f["is_audio"]]
+        video_files = [
+            f for f in self.file_list if not f["is_image"] and not f["is_audio"]
+        ]
+
+        # with a target size, ImageMagick encodes are deferred until all other
+        # files are compressed, so that the remaining budget is known
+        budget_files: List[FileObj] = []
 
         # Compress image files (non-EMF) with ImageMagick
         if len(image_files) > 0:
-            print(f"Compressing {len(image_files)} image(s) ...")
-            if self.num_cpus > 1:
-                process_map(_compress_image, image_files, max_workers=self.num_cpus)
+            if self.target_size is not None:
+                budget_files.extend(image_files)
             else:
-                for file in image_files:
-                    _compress_image(file)
+                with self._stage(
+                    "compress_images", count=len(image_files), workers=self.num_cpus
+                ):
+                    self._compress_images(image_files)
 
         # Compress EMF files
         if len(emf_files) > 0:
-            print(f"Compressing {len(emf_files)} .EMF file(s) ...")
             if self.use_libreoffice:
                 # compress ".emf" (microsoft) files using libreoffice sequentially
                 # (idk why, but it doesn't work in parallel)
-                self._libreoffice_compress_files(emf_files)
+                with self._stage("compress_emf", count=len(emf_files)):
+                    self._libreoffice_compress_files(emf_files)
             else:
                 # compress ".emf" files using "magick convert" which works only on windows
-                if self.num_cpus > 1:
-                    process_map(_compress_image, emf_files, max_workers=self.num_cpus)
+                if self.target_size is not None:
+                    budget_files.extend(emf_files)
                 else:
-                    for file in emf_files:
-                        _compress_image(file)
-
-        # Compress media files (video/audio) with ffmpeg and progress bar
-        if len(media_files) > 0:
-            print(f"Compressing {len(media_files)} media file(s) ...")
-            with tqdm(
-                total=len(media_files),
-                desc="Media files",
-                unit="file",
-                position=0,
-            ) as pbar:
-                for file in media_files:
-                    _compress_video_with_progress(file, pbar_position=1)
-                    pbar.update(1)
-            print()  # newline after progress bars
-
-        # remove borked files
+                    with self._stage(
+                        "compress_emf", count=len(emf_files), workers=self.num_cpus
+                    ):
+                        self._compress_images(emf_files)
+
+        # Compress audio files with ffmpeg
+        if len(audio_files) > 0:
+            with self._stage(
+                "compress_audio", count=len(audio_files), workers=self.num_cpus
+            ):
+                results = self._map(_compress_audio, audio_files)
+
+            for file, (output, info, error) in zip(audio_files, results):
+                file["output"] = output
+                if error is not None:
+                    self._message(
+                        f"could not analyze {file['input']}: {error}", level="warning"
+                    )
+                if info is not None:
+                    self._message(
+                        f"{Path(file['input']).name}: {info['channels']} channel(s), {info['sample_rate']} Hz"
+                        + (", dual mono" if info["dual_mono"] else "")
+                        + (", speech" if info["speech"] else ""),
+                        level="debug",
+                    )
+
+        # Compress video files with ffmpeg, reporting progress per file
+        if len(video_files) > 0:
+            with self._stage("compress_video", count=len(video_files)):
+                for file in video_files:
+                    self._compress_video(file)
+
+        if len(budget_files) > 0:
+            self._compress_images_to_budget(budget_files)
+
+        # remove borked files and files whose original was kept
         warnings = []
         for file in self.file_list:
-            if not Path(file["output"]).exists():
-                print(f"Warning: could not convert {file['input']}")
+            if file["output"] == file["input"]:
+                self._emit(
+                    "file_skipped", reason="original_smaller", **self._file_fields(file)
+                )
+                warnings.append(file)
+            elif not Path(file["output"]).exists():
+                self._emit("file_failed", **self._file_fields(file))
                 warnings.append(file)
             else:
                 output_size = file_size(file["output"])
                 file["output_size"] = output_size
+                self._emit(
+                    "file_compressed",
+                    output=Path(file["output"]).name,
+                    input_size=file["input_size"],
+                    output_size=output_size,
+                    duration=file["duration"],
+                    quality=file["quality"] if self._is_jpeg_output(file) else None,
+                    ssim=file["ssim"],
+                    **self._file_fields(file),
+                )
 
         for w in warnings:
             self.file_list.remove(w)
@@ -466,13 +1010,36 @@ class CompressPptx:
         for f in self.file_list:
             os.remove(f["input"])
 
+    def _is_jpeg_output(self, file: FileObj) -> bool:
+        """Whether a file was encoded as JPEG, i.e. its quality applies."""
+        return file["is_image"] and Path(file["output"]).suffix.lower() in (
+            ".jpg",
+            ".jpeg",
+        )
+
+    def _compress_video(self, file: FileObj) -> None:
+        """Compress a video file, emitting throttled progress events."""
+        throttle = ProgressThrottle(self.progress_interval)
+
+        def on_progress(percent: float) -> None:
+            if throttle.ready(percent):
+                self._emit("file_progress", percent=percent, **self._file_fields(file))
+
+        self._emit("file_started", **self._file_fields(file))
+        error, duration = _timed(
+            partial(_compress_video_with_progress, on_progress=on_progress), file
+        )
+        self._file_finished(file, duration)
+        if error is not None:
+            self._message(
+                f"could not probe the frame rate of {file['input']}, not capping it: {error}",
+                level="warning",
+            )
+
     def _replace_rels(self) -> None:
         if self.temp_dir is None:
             raise RuntimeError("Temp dir not created!")
 
-        if self.verbose:
-            print("Replacing metadata ...")
-
         for file in glob.iglob(
             os.path.join(self.temp_dir, "ppt", "**", "*.rels"), recursive=True
         ):
@@ -492,22 +1059,65 @@ class CompressPptx:
             with open(str(file), "w") as f:
                 f.write(content)
 
+    def _update_content_types(self) -> None:
+        if self.temp_dir is None:
+            raise RuntimeError("Temp dir not created!")
+
+        content_types_file = Path(self.temp_dir) / "[Content_Types].xml"
+        if not content_types_file.exists():
+            return
+
+        with open(content_types_file, encoding="utf-8") as f:
+            content = f.read()
+
+        for compress_file in self.file_list:
+            extension = Path(compress_file["output"]).suffix.lower().lstrip(".")
+            content_type = CONTENT_TYPES.get(extension)
+            if content_type is None or re.search(
+                rf'<Default\s+Extension="{re.escape(extension)}"',
+                content,
+                re.IGNORECASE,
+            ):
+                continue
+
+            self._message(f"Adding content type for .{extension} files", level="debug")
+            content = re.sub(
+                r"(<Types[^>]*>)",
+                rf'\1<Default Extension="{extension}" ContentType="{content_type}"/>',
+                content,
+                count=1,
+            )
+
+        with open(content_types_file, "w", encoding="utf-8") as f:
+            f.write(content)
+
     def _zip(self) -> None:
         if self.temp_dir is None:
             raise RuntimeError("Temp dir not created!")
 
         src_path = Path(self.temp_dir)
-        with zipfile.ZipFile(self.output_file, "w", zipfile.ZIP_DEFLATED) as zf:
+        with (
+            self._stage("zip"),
+            zipfile.ZipFile(self.output_file, "w", zipfile.ZIP_DEFLATED) as zf,
+        ):
             for file in src_path.rglob("*"):
                 zf.write(file, file.relative_to(src_path))
 
-        print(f"Output written to: {self.output_file}")
+        self._message(f"Output written to: {self.output_file}")
 
-    def _print_stats(self) -> None:
+    def _report_stats(self) -> None:
         input_size = file_size(self.input_file)
         output_size = file_size(self.output_file)
         percentage = round((input_size - output_size) / input_size * 100, 2)
-        print(f"Input file:  {human_readable_size(input_size)}")
-        print(
-            f"Output file: {human_readable_size(output_size)} ({percentage}% reduction)"
+        self._emit(
+            "finished",
+            output_file=self.output_file,
+            input_size=input_size,
+            output_size=output_size,
+            reduction=percentage,
         )
+        if self.target_size is not None and output_size > self.target_size:
+            self._message(
+                f"output file exceeds target size of {human_readable_size(self.target_size)}",
+                level="warning",
+            )
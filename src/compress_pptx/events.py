@@ -0,0 +1,176 @@
+import json
+import sys
+import time
+from typing import IO, Any, Callable, Dict, Optional
+
+from .util import human_readable_size
+
+# An event is a JSON-serializable dict with at least an "event" key naming its type:
+#
+# - stage_started / stage_finished: "stage", optionally "count" (number of files),
+#   "workers" and "duration" (seconds, when finished)
+# - file_queued: "file", "path", "size", "kind" and "video_size" for videos
+# - file_skipped: "file", "path", "reason" (too_small, transparent, original_smaller)
+# - file_started: "file", "path"
+# - file_progress: "file", "path", "percent"
+# - file_finished: "file", "path", "duration"
+# - file_compressed: "file", "path", "output", "input_size", "output_size",
+#   "duration", and "quality" and "ssim" for images
+# - file_failed: "file", "path"
+# - message: "level" (debug, info, warning), "text"
+# - finished: "input_size", "output_size", "reduction" (percent)
+Event = Dict[str, Any]
+EventSink = Callable[[Event], None]
+
+# messages printed on the console when a stage starts
+STAGE_MESSAGES = {
+    "extract": "Extracting file ...",
+    "compress_images": "Compressing {count} image(s) ...",
+    "compress_emf": "Compressing {count} .EMF file(s) ...",
+    "compress_audio": "Compressing {count} audio file(s) ...",
+    "compress_video": "Compressing {count} video file(s) ...",
+    "estimate_sizes": "Compressing {count} image(s) to fit the target size ...",
+    "downscale_images": "Target size cannot be reached by lowering quality, downscaling images to {percent}% ...",
+}
+
+
+class ProgressThrottle:
+    """Limit how often progress is reported, always letting completion through."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._last: Optional[float] = None
+
+    def ready(self, percent: float) -> bool:
+        now = time.monotonic()
+        if percent >= 100 or self._last is None or now - self._last >= self.interval:
+            self._last = now
+            return True
+        return False
+
+
+class QuietSink:
+    """Discard all events."""
+
+    def __call__(self, event: Event) -> None:
+        pass
+
+
+class JsonLinesSink:
+    """Write each event as one line of JSON, by default to stdout."""
+
+    def __init__(self, stream: Optional[IO[str]] = None) -> None:
+        self.stream = stream
+
+    def __call__(self, event: Event) -> None:
+        stream = self.stream or sys.stdout
+        stream.write(json.dumps(event, default=str) + "\n")
+        stream.flush()
+
+
+class ConsoleSink:
+    """Print human-readable messages and progress bars."""
+
+    def __init__(self, verbose: bool = False) -> None:
+        self.verbose = verbose
+        self._stage_bar: Any = None
+        self._file_bar: Any = None
+
+    def __call__(self, event: Event) -> None:
+        handler = getattr(self, f"_on_{event['event']}", None)
+        if handler is not None:
+            handler(event)
+
+    def _on_message(self, event: Event) -> None:
+        if event["level"] == "warning":
+            print(f"Warning: {event['text']}")
+        elif event["level"] == "info" or self.verbose:
+            print(event["text"])
+
+    def _on_stage_started(self, event: Event) -> None:
+        message = STAGE_MESSAGES.get(event["stage"])
+        if message is not None:
+            print(message.format(**event))
+        elif self.verbose and event["stage"] == "replace_rels":
+            print("Replacing metadata ...")
+
+        # show a bar for parallel stages and for videos, which take long
+        if event["stage"] == "compress_video" or event.get("workers", 1) > 1:
+            from tqdm import tqdm
+
+            desc = "Video files" if event["stage"] == "compress_video" else None
+            self._stage_bar = tqdm(
+                total=event.get("count"), desc=desc, unit="file", position=0
+            )
+
+    def _on_stage_finished(self, event: Event) -> None:
+        if self._stage_bar is not None:
+            self._stage_bar.close()
+            self._stage_bar = None
+            if event["stage"] == "compress_video":
+                print()  # newline after progress bars
+
+    def _on_file_queued(self, event: Event) -> None:
+        if not self.verbose:
+            return
+        print(
+            f"{event['file']} added to conversion queue ({human_readable_size(event['size'])})"
+        )
+        if event.get("video_size") is not None:
+            width, height = event["video_size"]
+            print(f"{event['file']} will be fit into {width}x{height}")
+
+    def _on_file_skipped(self, event: Event) -> None:
+        if not self.verbose:
+            return
+        if event["reason"] == "transparent":
+            print(f"Skipping {event['file']} because it contains transparency")
+        elif event["reason"] == "original_smaller":
+            print(f"{event['file']}: keeping original")
+
+    def _on_file_started(self, event: Event) -> None:
+        if self._stage_bar is None:
+            return
+        from tqdm import tqdm
+
+        self._file_bar = tqdm(
+            total=100,
+            desc=f"  {event['file']}",
+            unit="%",
+            position=1,
+            leave=False,
+            bar_format="{desc}: {percentage:3.0f}%|{bar}| [{elapsed}<{remaining}]",
+        )
+
+    def _on_file_progress(self, event: Event) -> None:
+        if self._file_bar is not None:
+            self._file_bar.n = event["percent"]
+            self._file_bar.refresh()
+
+    def _on_file_finished(self, event: Event) -> None:
+        if self._file_bar is not None:
+            self._file_bar.close()
+            self._file_bar = None
+        if self._stage_bar is not None:
+            self._stage_bar.update(1)
+
+    def _on_file_compressed(self, event: Event) -> None:
+        if not self.verbose:
+            return
+        details = [
+            f"{human_readable_size(event['input_size'])} -> {human_readable_size(event['output_size'])}"
+        ]
+        if event.get("quality") is not None:
+            details.append(f"quality {event['quality']}")
+        if event.get("ssim") is not None:
+            details.append(f"SSIM {event['ssim']:.4f}")
+        print(f"{event['file']} -> {event['output']}: {', '.join(details)}")
+
+    def _on_file_failed(self, event: Event) -> None:
+        print(f"Warning: could not convert {event['path']}")
+
+    def _on_finished(self, event: Event) -> None:
+        print(f"Input file:  {human_readable_size(event['input_size'])}")
+        print(
+            f"Output file: {human_readable_size(event['output_size'])} ({event['reduction']}% reduction)"
+        )
@@ -0,0 +1,168 @@
+from typing import Callable, Dict, List, Tuple
+
+from .util import run_command
+
+# longest edge of the luma plane used for quality measurement
+SSIM_MAX_DIMENSION = 512
+# side length of the uniform SSIM window
+SSIM_WINDOW_SIZE = 7
+
+
+def has_numpy() -> bool:
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _parse_pgm(data: bytes):
+    """Parse a binary (P5) PGM image into a 2D float array."""
+    import numpy as np
+
+    # header: magic, width, height, maxval, separated by whitespace
+    fields: List[bytes] = []
+    pos = 0
+    while len(fields) < 4:
+        while data[pos : pos + 1].isspace():
+            pos += 1
+        if data[pos : pos + 1] == b"#":
+            pos = data.index(b"\n", pos) + 1
+            continue
+        start = pos
+        while not data[pos : pos + 1].isspace():
+            pos += 1
+        fields.append(data[start:pos])
+    pos += 1  # single whitespace after maxval
+
+    if fields[0] != b"P5":
+        raise ValueError(f"Unsupported PGM format: {fields[0]!r}")
+    width, height, maxval = int(fields[1]), int(fields[2]), int(fields[3])
+    dtype = ">u2" if maxval > 255 else "u1"
+    plane = np.frombuffer(data, dtype=dtype, count=width * height, offset=pos)
+    return plane.reshape(height, width).astype(np.float64) * (255.0 / maxval)
+
+
+def read_luma(
+    convert_cmd: List[str],
+    input_file: str,
+    transparency: str,
+    verbose: bool = False,
+):
+    """Read a downsampled luma plane of the first frame of an image."""
+    size = f"{SSIM_MAX_DIMENSION}x{SSIM_MAX_DIMENSION}>"
+    cmd = convert_cmd + [
+        input_file + "[0]",
+        "-background",
+        transparency,
+        "-flatten",
+        "-colorspace",
+        "Gray",
+        "-resize",
+        size,
+        "-depth",
+        "8",
+        "pgm:-",
+    ]
+    stdout, _ = run_command(cmd, verbose=verbose, decode=False)
+    return _parse_pgm(stdout)
+
+
+def _box_mean(plane, window: int):
+    """Mean over all valid window x window blocks, using an integral image."""
+    import numpy as np
+
+    integral = np.pad(plane, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    total = (
+        integral[window:, window:]
+        - integral[:-window, window:]
+        - integral[window:, :-window]
+        + integral[:-window, :-window]
+    )
+    return total / float(window * window)
+
+
+def ssim(reference, distorted, window: int = SSIM_WINDOW_SIZE) -> float:
+    """
+    Compute the mean structural similarity (SSIM) between two luma planes.
+
+    Uses a uniform window as in Wang et al. (2004), with values in [0, 255].
+
+    Args:
+        reference: Reference luma plane (2D array)
+        distorted: Distorted luma plane of the same shape
+        window (int, optional): Window side length. Defaults to 7.
+
+    Returns:
+        float: Mean SSIM, 1.0 for identical planes
+    """
+    if reference.shape != distorted.shape:
+        raise ValueError(f"Shape mismatch: {reference.shape} vs. {distorted.shape}")
+
+    # very small images: use a single window over the whole plane
+    window = min(window, *reference.shape)
+
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+
+    mu_x = _box_mean(reference, window)
+    mu_y = _box_mean(distorted, window)
+    # unbiased (co)variances, as in the reference implementation
+    n = window * window
+    norm = n / (n - 1) if n > 1 else 1.0
+    var_x = (_box_mean(reference * reference, window) - mu_x * mu_x) * norm
+    var_y = (_box_mean(distorted * distorted, window) - mu_y * mu_y) * norm
+    cov_xy = (_box_mean(reference * distorted, window) - mu_x * mu_y) * norm
+
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * cov_xy + c2)) / (
+        (mu_x * mu_x + mu_y * mu_y + c1) * (var_x + var_y + c2)
+    )
+    return float(ssim_map.mean())
+
+
+def search_quality(
+    encode: Callable[[int], None],
+    measure: Callable[[], float],
+    target: float,
+    min_quality: int,
+    max_quality: int,
+) -> Tuple[int, float]:
+    """
+    Binary search for the lowest quality whose output reaches a target score.
+
+    The output left behind by `encode` always corresponds to the returned quality.
+
+    Args:
+        encode: Callable encoding the image at a given quality
+        measure: Callable returning the score of the last encoded output
+        target (float): Minimum score to reach
+        min_quality (int): Lower bound of the search
+        max_quality (int): Upper bound of the search
+
+    Returns:
+        Tuple[int, float]: The chosen quality and its score. If no quality in range
+            reaches the target, the upper bound is chosen.
+    """
+    scores: Dict[int, float] = {}
+    low, high = min_quality, max_quality
+    chosen = max_quality
+    last_quality = None
+    while low <= high:
+        quality = (low + high) // 2
+        encode(quality)
+        last_quality = quality
+        scores[quality] = measure()
+        if scores[quality] >= target:
+            chosen = quality
+            high = quality - 1
+        else:
+            low = quality + 1
+
+    if chosen not in scores:
+        # empty range
+        encode(chosen)
+        scores[chosen] = measure()
+    elif last_quality != chosen:
+        encode(chosen)
+
+    return chosen, scores[chosen]
@@ -1,3 +1,5 @@
+import functools
+import json
 import subprocess
 import shlex
 from pathlib import Path
@@ -5,33 +7,89 @@ import os
 import sys
 
 
-def which(program):
+def _is_exe(fpath):
+    found = os.path.isfile(fpath) and os.access(fpath, os.X_OK)
+    if not found and sys.platform == "win32":
+        fpath = fpath + ".exe"
+        found = os.path.isfile(fpath) and os.access(fpath, os.X_OK)
+    return found
+
+
+def _search_path(program, search_path):
     """
-    Find a program in PATH and return path
+    Find a program in the given search path and return path
     From: http://stackoverflow.com/q/377017/
     """
-
-    def is_exe(fpath):
-        found = os.path.isfile(fpath) and os.access(fpath, os.X_OK)
-        if not found and sys.platform == "win32":
-            fpath = fpath + ".exe"
-            found = os.path.isfile(fpath) and os.access(fpath, os.X_OK)
-        return found
-
     fpath, _ = os.path.split(program)
     if fpath:
-        if is_exe(program):
+        if _is_exe(program):
             return program
     else:
-        for path in os.environ["PATH"].split(os.pathsep):
+        for path in search_path.split(os.pathsep):
             path = os.path.expandvars(os.path.expanduser(path)).strip('"')
             exe_file = os.path.join(path, program)
-            if is_exe(exe_file):
+            if _is_exe(exe_file):
                 return exe_file
 
     return None
 
 
+def _tool_cache_file() -> Path:
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join("~", ".cache")
+    return Path(os.path.expanduser(cache_dir)) / "compress-pptx" / "tools.json"
+
+
+def _read_tool_cache(search_path) -> dict:
+    """Read the programs found before for the given search path."""
+    try:
+        with open(_tool_cache_file()) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("path") != search_path:
+        return {}
+    tools = cache.get("tools")
+    return tools if isinstance(tools, dict) else {}
+
+
+def _write_tool_cache(search_path, tools) -> None:
+    cache_file = _tool_cache_file()
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        # write atomically, since many instances may run at the same time
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}")
+        with open(tmp_file, "w") as f:
+            json.dump({"path": search_path, "tools": tools}, f)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+
+
+@functools.lru_cache(maxsize=None)
+def _which(program, search_path):
+    tools = _read_tool_cache(search_path)
+    cached = tools.get(program)
+    if isinstance(cached, str) and _is_exe(cached):
+        return cached
+
+    found = _search_path(program, search_path)
+    # only cache programs that were found, so that newly installed ones are picked up
+    if found is not None:
+        tools[program] = found
+        _write_tool_cache(search_path, tools)
+    return found
+
+
+def which(program):
+    """
+    Find a program in PATH and return path.
+
+    Results are memoized per process and cached on disk for the same PATH, so
+    repeated invocations don't have to scan PATH again.
+    """
+    return _which(program, os.environ.get("PATH", ""))
+
+
 def file_size(file) -> int:
     return Path(file).stat().st_size
 
@@ -47,12 +105,13 @@ def human_readable_size(size, decimal_places=2):
     return f"{size:.{decimal_places}f} {unit}"
 
 
-def run_command(cmd, dry_run=False, verbose=False):
+def run_command(cmd, dry_run=False, verbose=False, decode=True):
     """
-    Run a command directly
+    Run a command directly. If decode is False, stdout is returned as bytes.
     """
     if dry_run or verbose:
-        print(" ".join([shlex.quote(str(c)) for c in cmd]))
+        # on stderr, to keep stdout free for JSON events
+        print(" ".join([shlex.quote(str(c)) for c in cmd]), file=sys.stderr)
         if dry_run:
             return None, None
 
@@ -60,6 +119,8 @@ def run_command(cmd, dry_run=False, verbose=False):
     stdout, stderr = process.communicate()
 
     if process.returncode == 0:
+        if not decode:
+            return stdout, stderr.decode("utf-8")
         return stdout.decode("utf-8"), stderr.decode("utf-8")
     else:
         raise RuntimeError(
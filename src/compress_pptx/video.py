@@ -0,0 +1,137 @@
+import json
+import math
+from fractions import Fraction
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .util import run_command
+
+EMU_PER_INCH = 914400
+
+NAMESPACES = {
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
+    "p14": "http://schemas.microsoft.com/office/powerpoint/2010/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+
+R_LINK = f"{{{NAMESPACES['r']}}}link"
+R_EMBED = f"{{{NAMESPACES['r']}}}embed"
+
+# ffmpeg options setting the video filter chain
+VIDEO_FILTER_OPTIONS = ("-vf", "-filter:v")
+
+
+def _relationship_targets(rels_file: Path) -> Dict[str, str]:
+    """Map the relationship IDs of a part to the file names of their targets."""
+    import xml.etree.ElementTree as ET
+
+    targets = {}
+    for rel in ET.parse(rels_file).getroot().findall("rel:Relationship", NAMESPACES):
+        if rel.get("TargetMode") == "External":
+            continue
+        targets[rel.get("Id", "")] = Path(rel.get("Target", "")).name
+    return targets
+
+
+def media_extents(temp_dir: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Find the largest on-slide extent of every video in an extracted presentation.
+
+    Videos are found through the `a:videoFile` and `p14:media` references of `p:pic`
+    elements in slides, layouts and masters.
+
+    Args:
+        temp_dir (str): Directory the presentation was extracted to
+
+    Returns:
+        Dict[str, Tuple[int, int]]: Width and height in EMU per media file name
+    """
+    import xml.etree.ElementTree as ET
+
+    extents: Dict[str, Tuple[int, int]] = {}
+    for rels_file in Path(temp_dir, "ppt").glob("*/_rels/*.xml.rels"):
+        part = rels_file.parent.parent / rels_file.name[: -len(".rels")]
+        if not part.exists():
+            continue
+        targets = _relationship_targets(rels_file)
+
+        for pic in ET.parse(part).getroot().iter(f"{{{NAMESPACES['p']}}}pic"):
+            ext = pic.find("p:spPr/a:xfrm/a:ext", NAMESPACES)
+            if ext is None:
+                continue
+            cx, cy = int(ext.get("cx", 0)), int(ext.get("cy", 0))
+
+            rel_ids = [
+                video.get(R_LINK)
+                for video in pic.iter(f"{{{NAMESPACES['a']}}}videoFile")
+            ] + [
+                media.get(R_EMBED)
+                for media in pic.iter(f"{{{NAMESPACES['p14']}}}media")
+            ]
+            for rel_id in rel_ids:
+                if rel_id not in targets:
+                    continue
+                name = targets[rel_id]
+                width, height = extents.get(name, (0, 0))
+                extents[name] = (max(width, cx), max(height, cy))
+
+    return extents
+
+
+def extent_to_pixels(extent: Tuple[int, int], dpi: float) -> Tuple[int, int]:
+    """Convert an extent in EMU to pixels at a given DPI, rounded up to even numbers."""
+    width, height = (2 * math.ceil(emu / EMU_PER_INCH * dpi / 2) for emu in extent)
+    return max(width, 2), max(height, 2)
+
+
+def scale_filter(width: int, height: int) -> str:
+    """Return an ffmpeg filter fitting a video into a frame, without upscaling."""
+    return (
+        f"scale=w='min(iw,{width})':h='min(ih,{height})'"
+        ":force_original_aspect_ratio=decrease:force_divisible_by=2"
+    )
+
+
+def add_video_filters(args: List[str], filters: List[str]) -> List[str]:
+    """
+    Add video filters to ffmpeg output options.
+
+    If the options already set a video filter chain, the filters are appended to it,
+    since ffmpeg only uses the last chain given.
+    """
+    if len(filters) == 0:
+        return args
+    args = list(args)
+    for i, arg in enumerate(args[:-1]):
+        if arg in VIDEO_FILTER_OPTIONS:
+            args[i + 1] = ",".join([args[i + 1]] + filters)
+            return args
+    return ["-vf", ",".join(filters)] + args
+
+
+def probe_frame_rate(
+    ffprobe_path: str, input_file: str, verbose: bool = False
+) -> Optional[float]:
+    """Return the frame rate of the first video stream, if known."""
+    cmd = [
+        ffprobe_path,
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "stream=avg_frame_rate",
+        "-of",
+        "json",
+        input_file,
+    ]
+    stdout, _ = run_command(cmd, verbose=verbose)
+    streams = json.loads(stdout).get("streams", [])
+    if len(streams) == 0:
+        return None
+    try:
+        return float(Fraction(streams[0]["avg_frame_rate"]))
+    except (KeyError, ValueError, ZeroDivisionError):
+        return None
@@ -1,9 +1,36 @@
 #!/usr/bin/env pytest
 
+import io
+import json
 import os
+import subprocess
+import sys
 import tempfile
+import zipfile
 
+import pytest
+
+from compress_pptx import util
+from compress_pptx.audio import AudioInfo, audio_args, classify_audio, parse_volume
+from compress_pptx.budget import (
+    ZIP_ENTRY_OVERHEAD,
+    allocate,
+    estimate_zipped_size,
+    resize_percent,
+)
 from compress_pptx.compress_pptx import CompressPptx
+from compress_pptx.events import JsonLinesSink, ProgressThrottle
+from compress_pptx.perceptual import search_quality, ssim
+from compress_pptx.video import add_video_filters, extent_to_pixels, media_extents
+
+
+@pytest.fixture(autouse=True)
+def tool_cache(tmp_path, monkeypatch):
+    # keep the tool cache out of the home directory and isolated between tests
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    util._which.cache_clear()
+    yield
+    util._which.cache_clear()
 
 
 def test_conversion():
@@ -17,6 +44,102 @@ def test_conversion():
     os.remove(output_file)
 
 
+def test_conversion_smallest_format():
+    here = os.path.dirname(__file__)
+    input_file = os.path.join(here, "test.pptx")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_file = os.path.join(temp_dir, "test-compressed.pptx")
+        CompressPptx(input_file, output_file, size=0, smallest_format=True).run()
+
+        with zipfile.ZipFile(output_file) as zf:
+            content_types = zf.read("[Content_Types].xml").decode("utf-8")
+            media = [
+                n
+                for n in zf.namelist()
+                if n.startswith("ppt/media/") and not n.endswith("/")
+            ]
+
+        # every media file must have a registered content type
+        assert len(media) > 0
+        for name in media:
+            extension = name.rsplit(".", 1)[-1]
+            assert f'Extension="{extension}"' in content_types
+
+
+def _fixed_size(input_file):
+    """Return the zipped size of everything but the media files of a presentation."""
+    with zipfile.ZipFile(input_file) as zf:
+        return sum(
+            i.compress_size
+            for i in zf.infolist()
+            if not i.filename.startswith("ppt/media/")
+        )
+
+
+def test_conversion_target_size():
+    here = os.path.dirname(__file__)
+    input_file = os.path.join(here, "test.pptx")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # the size at the lowest quality tried
+        lowest_file = os.path.join(temp_dir, "lowest.pptx")
+        CompressPptx(input_file, lowest_file, size=0, quality=30).run()
+        lowest_size = os.path.getsize(lowest_file)
+        fixed_size = _fixed_size(input_file)
+
+        # reachable by lowering the quality
+        target_size = lowest_size + lowest_size // 2
+        output_file = os.path.join(temp_dir, "quality.pptx")
+        events = []
+        CompressPptx(
+            input_file,
+            output_file,
+            size=0,
+            target_size=target_size,
+            event_sink=events.append,
+        ).run()
+        assert os.path.getsize(output_file) <= target_size
+        stages = {e["stage"] for e in events if e["event"] == "stage_started"}
+        assert "downscale_images" not in stages
+
+        # only reachable by downscaling
+        target_size = fixed_size + (lowest_size - fixed_size) // 2
+        output_file = os.path.join(temp_dir, "downscaled.pptx")
+        events = []
+        CompressPptx(
+            input_file,
+            output_file,
+            size=0,
+            target_size=target_size,
+            event_sink=events.append,
+        ).run()
+        assert os.path.getsize(output_file) < lowest_size
+        stages = {e["stage"] for e in events if e["event"] == "stage_started"}
+        assert "downscale_images" in stages
+
+
+def test_estimate_fixed_size_kept_original():
+    here = os.path.dirname(__file__)
+    input_file = os.path.join(here, "test.pptx")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        compress = CompressPptx(
+            input_file, os.path.join(temp_dir, "test-compressed.pptx"), size=0
+        )
+        compress.temp_dir = os.path.join(temp_dir, "extracted")
+        media_dir = os.path.join(compress.temp_dir, "ppt", "media")
+        os.makedirs(media_dir)
+        with open(os.path.join(media_dir, "image1.png"), "wb") as f:
+            f.write(os.urandom(100000))
+        compress._find_files()
+
+        # a file whose original was kept still ends up in the output
+        file = compress.file_list[0]
+        file["output"] = file["input"]
+        assert compress._estimate_fixed_size([]) >= 100000
+
+
 def test_extract():
     here = os.path.dirname(__file__)
     input_file = os.path.join(here, "test.pptx")
@@ -53,3 +176,238 @@ def test_extract_creates_directory():
         # Check that media files were extracted
         extracted_files = os.listdir(extract_dir)
         assert len(extracted_files) > 0
+
+
+def test_ssim():
+    np = pytest.importorskip("numpy")
+    rng = np.random.default_rng(0)
+    reference = rng.uniform(0, 255, (64, 48))
+
+    assert ssim(reference, reference) == pytest.approx(1.0)
+
+    slightly_noisy = np.clip(reference + rng.normal(0, 5, reference.shape), 0, 255)
+    very_noisy = np.clip(reference + rng.normal(0, 50, reference.shape), 0, 255)
+    assert 1.0 > ssim(reference, slightly_noisy) > ssim(reference, very_noisy)
+
+
+def test_search_quality():
+    encoded = []
+    quality, score = search_quality(
+        encoded.append, lambda: encoded[-1] / 100, 0.62, 40, 95
+    )
+    assert quality == 62
+    assert score == pytest.approx(0.62)
+    # the last encode must match the chosen quality
+    assert encoded[-1] == 62
+
+    # fall back to the upper bound if the target cannot be reached
+    encoded = []
+    quality, _ = search_quality(encoded.append, lambda: 0.5, 0.99, 40, 95)
+    assert quality == 95
+    assert encoded[-1] == 95
+
+
+def test_allocate():
+    photo = {30: 300, 60: 500, 85: 900}
+    diagram = {30: 100, 60: 120, 85: 150}
+
+    # everything fits at the highest quality
+    assert allocate([photo, diagram], 2000) == [85, 85]
+    # the photo saves far more bytes per quality point, so it is lowered first
+    assert allocate([photo, diagram], 700) == [60, 85]
+    # even the lowest qualities do not fit
+    assert allocate([photo, diagram], 350) is None
+
+
+def test_estimate_zipped_size(tmp_path):
+    text = tmp_path / "slide1.xml"
+    text.write_bytes(b"<p:sp/>" * 100000)
+    assert estimate_zipped_size(text, "slide1.xml") < 10000
+
+    # already compressed formats are counted at their stored size
+    video = tmp_path / "media1.mp4"
+    video.write_bytes(bytes(100000))
+    assert estimate_zipped_size(video, "media1.mp4") == (
+        100000 + ZIP_ENTRY_OVERHEAD + 2 * len("media1.mp4")
+    )
+
+
+def test_resize_percent():
+    assert resize_percent(1000, 1000) == 94
+    assert resize_percent(1000, 250) == 47
+    assert resize_percent(1000, 0) == 10
+
+
+def test_audio_args():
+    stereo_music: AudioInfo = {
+        "channels": 2,
+        "sample_rate": 48000,
+        "dual_mono": False,
+        "speech": False,
+    }
+    assert audio_args(stereo_music, 24000, "48k") == []
+
+    dual_mono: AudioInfo = {**stereo_music, "dual_mono": True}
+    assert audio_args(dual_mono, 24000, "48k") == ["-ac", "1"]
+
+    speech: AudioInfo = {**stereo_music, "speech": True}
+    assert audio_args(speech, 24000, "48k") == [
+        "-ac",
+        "1",
+        "-ar",
+        "24000",
+        "-b:a",
+        "48k",
+    ]
+
+
+def test_classify_audio():
+    # mono narration with little energy above 8 kHz
+    assert classify_audio(1, 48000, -20.0, -60.0) == (False, True)
+    # full-band content
+    assert classify_audio(1, 48000, -20.0, -40.0) == (False, False)
+    # identical channels
+    assert classify_audio(2, 48000, -20.0, -40.0, (-91.0, -91.0)) == (True, False)
+    assert classify_audio(2, 48000, -20.0, -60.0, (-91.0, -91.0)) == (True, True)
+    # stereo speech with a little room ambience
+    assert classify_audio(2, 48000, -20.0, -60.0, (-45.0, -30.0)) == (False, True)
+    # band-limited stereo music must not be downmixed
+    assert classify_audio(2, 48000, -20.0, -60.0, (-30.0, -10.0)) == (False, False)
+    # too low a sample rate to resample for speech
+    assert classify_audio(1, 16000, -20.0, -60.0) == (False, False)
+
+
+def test_parse_volume():
+    stderr = (
+        "[Parsed_volumedetect_0 @ 0x1] n_samples: 1000\n"
+        "[Parsed_volumedetect_0 @ 0x1] mean_volume: -25.3 dB\n"
+        "[Parsed_volumedetect_0 @ 0x1] max_volume: -inf dB\n"
+    )
+    assert parse_volume(stderr) == (-25.3, float("-inf"))
+
+
+def test_media_extents():
+    slide = (
+        '<p:sld xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"'
+        ' xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main"'
+        ' xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        "<p:cSld><p:spTree><p:pic><p:nvPicPr><p:nvPr>"
+        '<a:videoFile r:link="rId2"/>'
+        "</p:nvPr></p:nvPicPr><p:spPr><a:xfrm>"
+        '<a:off x="0" y="0"/><a:ext cx="6096000" cy="3429000"/>'
+        "</a:xfrm></p:spPr></p:pic></p:spTree></p:cSld></p:sld>"
+    )
+    rels = (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/video"'
+        ' Target="../media/media1.mp4"/>'
+        "</Relationships>"
+    )
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        slides_dir = os.path.join(temp_dir, "ppt", "slides")
+        os.makedirs(os.path.join(slides_dir, "_rels"))
+        with open(os.path.join(slides_dir, "slide1.xml"), "w") as f:
+            f.write(slide)
+        with open(os.path.join(slides_dir, "_rels", "slide1.xml.rels"), "w") as f:
+            f.write(rels)
+
+        extents = media_extents(temp_dir)
+
+    assert extents == {"media1.mp4": (6096000, 3429000)}
+    # 6.67 x 3.75 inches
+    assert extent_to_pixels(extents["media1.mp4"], 96) == (640, 360)
+
+
+def test_add_video_filters():
+    assert add_video_filters(["-preset", "slow"], []) == ["-preset", "slow"]
+    assert add_video_filters(["-preset", "slow"], ["fps=30"]) == [
+        "-vf",
+        "fps=30",
+        "-preset",
+        "slow",
+    ]
+    # a user-supplied filter chain is kept and extended
+    assert add_video_filters(["-vf", "crop=640:480"], ["scale=320:240", "fps=30"]) == [
+        "-vf",
+        "crop=640:480,scale=320:240,fps=30",
+    ]
+    assert add_video_filters(["-filter:v", "hflip"], ["fps=30"]) == [
+        "-filter:v",
+        "hflip,fps=30",
+    ]
+
+
+def test_lazy_imports():
+    # heavy dependencies must only be imported when they are needed
+    code = (
+        "import sys, compress_pptx.__main__;"
+        "print(','.join(m for m in ('tqdm', 'ffmpeg_progress_yield', 'numpy',"
+        " 'concurrent.futures', 'importlib.metadata') if m in sys.modules))"
+    )
+    stdout = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    assert stdout.strip() == ""
+
+
+def test_which_cache(monkeypatch):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        bin_dir = os.path.join(temp_dir, "bin")
+        os.makedirs(bin_dir)
+        program = os.path.join(bin_dir, "some-tool")
+        with open(program, "w") as f:
+            f.write("#!/bin/sh\n")
+        os.chmod(program, 0o755)
+
+        monkeypatch.setenv("PATH", bin_dir)
+        monkeypatch.setenv("XDG_CACHE_HOME", os.path.join(temp_dir, "cache"))
+        util._which.cache_clear()
+
+        assert util.which("some-tool") == program
+        assert util.which("other-tool") is None
+        with open(os.path.join(temp_dir, "cache", "compress-pptx", "tools.json")) as f:
+            assert json.load(f) == {"path": bin_dir, "tools": {"some-tool": program}}
+
+        # a stale cache entry is ignored
+        os.remove(program)
+        util._which.cache_clear()
+        assert util.which("some-tool") is None
+
+
+def test_json_lines_sink():
+    stream = io.StringIO()
+    sink = JsonLinesSink(stream)
+    sink({"event": "stage_started", "stage": "zip"})
+    sink({"event": "finished", "input_size": 2, "output_size": 1, "reduction": 50.0})
+    events = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [e["event"] for e in events] == ["stage_started", "finished"]
+    assert events[1]["reduction"] == 50.0
+
+
+def test_json_progress_verbose():
+    here = os.path.dirname(__file__)
+    input_file = os.path.join(here, "test.pptx")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_file = os.path.join(temp_dir, "test-compressed.pptx")
+        stdout = subprocess.run(
+            [sys.executable, "-m", "compress_pptx", "--progress", "json", "-v"]
+            + ["-s", "0", "-o", output_file, input_file],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+
+    # commands shown with -v must not end up between the events
+    events = [json.loads(line) for line in stdout.splitlines()]
+    assert events[-1]["event"] == "finished"
+
+
+def test_progress_throttle():
+    throttle = ProgressThrottle(60)
+    assert throttle.ready(0)
+    assert not throttle.ready(50)
+    # completion is always reported
+    assert throttle.ready(100)
+    assert ProgressThrottle(0).ready(10)